@@ -1,106 +1,228 @@
+from __future__ import annotations
+
 import streamlit as st
 import pandas as pd
+import numpy as np
+import hashlib
+import itertools
 import re
+import threading
 from io import BytesIO
 
 st.set_page_config(page_title="NBA Draft Board — Blend ADP", layout="wide")
 st.title("🏀 NBA Fantasy Draft Board — Blend ADP")
 
+# -------- Precompiled patterns (hot path in PDF parsing) --------
+_WS        = re.compile(r"\s+")
+_BLEND_HDR = re.compile(r"\bBL(END)?\b", re.I)
+_NUM_END   = re.compile(r"(\d+(?:\.\d+)?)\s*$")
+_LEAD_IDX  = re.compile(r"^\s*\d+[\.\-]?\s*")
+_POS_PAREN = re.compile(r"\(([A-Z/]+)\)")
+_TEAM      = re.compile(r"[A-Z]{2,4}")
+_URL       = re.compile(r"^https?://", re.I)
+_SKIP      = re.compile(r"(https?://\S+)|(ADP Data|Hashtag Basketball|Season|Updated|\bBL(END)?\b)", re.I)
+_BL_FULL   = re.compile(r"bl(end)?", re.I)
+_NUM       = re.compile(r"(\d+(?:\.\d+)?)")
+
+def _clean(s: str) -> str:
+    return _WS.sub(" ", s or "").strip()
+
+def _safe_get(r: list, i: int | None):
+    """r[i], or None when the column is missing or the row is short."""
+    return r[i] if i is not None and 0 <= i < len(r) else None
+
+def _rows_from_tables(page) -> list:
+    """Rows from pdfplumber table detection (header row must contain BL/BLEND)."""
+    rows = []
+    for tbl in (page.extract_tables() or []):
+        # Find header row that has BL or BLEND
+        header_idx = None
+        for i, r in enumerate(tbl[:3]):
+            joined = " ".join([_clean(c) for c in r if c])
+            if _BLEND_HDR.search(joined):
+                header_idx = i; break
+        if header_idx is not None:
+            headers = [(_clean(c) or f"C{j}") for j, c in enumerate(tbl[header_idx])]
+            colmap = {h.lower(): j for j, h in enumerate(headers)}
+            # locate likely columns
+            blend_idx = None
+            for j, h in enumerate(headers):
+                if _BL_FULL.fullmatch(_clean(h).lower()):
+                    blend_idx = j; break
+            player_idx = colmap.get("player", 0)
+            team_idx   = colmap.get("team")
+            pos_idx    = colmap.get("pos")
+            for r in tbl[header_idx+1:]:
+                # The player cell alone decides if a row is usable — no full-row any() scan
+                player_cell = _safe_get(r, player_idx)
+                if not player_cell: continue
+                player = _clean(player_cell)
+                if len(player.split()) < 2: continue
+                team = _clean(_safe_get(r, team_idx))
+                pos  = _clean(_safe_get(r, pos_idx))
+                blend_raw = _clean(_safe_get(r, blend_idx))
+                # numeric at end of cell
+                m = _NUM.search(blend_raw) if blend_raw else None
+                blend = float(m.group(1)) if m else None
+                rows.append((player, team, pos, blend))
+    return rows
+
+def _rows_from_text(text: str) -> list:
+    """Rows from a page's text layer (ignores URLs and header/footer lines)."""
+    rows = []
+    for raw in text.splitlines():
+        line = _clean(raw)
+        if not line: 
+            continue
+        # Cheap pre-filter before any regex: player lines end in the Blend number
+        if not line[-1:].isdigit():
+            continue
+        # Skip obvious headers/footers/links
+        if _SKIP.search(line):
+            continue
+        # Last float on line as Blend
+        m_end = _NUM_END.search(line)
+        if not m_end:
+            continue
+        blend = float(m_end.group(1))
+        body = line[:m_end.start()].strip()
+        m_idx = _LEAD_IDX.match(body)  # remove leading index like "12." or "12 -"
+        if m_idx:
+            body = body[m_idx.end():]
+
+        # Try to peel team code (2-4 caps) at end; keep simple pos detection in parentheses
+        pos = ""
+        m_pos = _POS_PAREN.search(body)
+        if m_pos:
+            pos = m_pos.group(1)
+            body = (body[:m_pos.start()] + body[m_pos.end():]).strip()
+
+        parts = body.split()
+        team = ""
+        if parts and _TEAM.fullmatch(parts[-1]):
+            team = parts[-1]; parts = parts[:-1]
+        player = _clean(" ".join(parts))
+        # Also skip anything that looks like a bare link that slipped through
+        if _URL.match(player):
+            continue
+        if len(player.split()) >= 2:
+            rows.append((player, team, pos, blend))
+    return rows
+
+def _parse_page(page, prefer_text: bool = True) -> list:
+    """Parse one pdfplumber page; return a list of (player, team, pos, blend) tuples.
+
+    The preferred extractor runs first; the other only runs if it finds nothing,
+    so pages are never ingested twice and table detection is skipped when the
+    text layer is enough.
+    """
+    if prefer_text:
+        return _rows_from_text(page.extract_text() or "") or _rows_from_tables(page)
+    return _rows_from_tables(page) or _rows_from_text(page.extract_text() or "")
+
+@st.cache_resource
+def _pdfium_lock() -> threading.Lock:
+    """Process-wide lock for pypdfium2 calls.
+
+    PDFium is not thread-safe even across documents, and Streamlit runs each session's
+    script in its own thread. A module-level Lock would be recreated on every script
+    run, so the single instance lives in cache_resource instead.
+    """
+    return threading.Lock()
+
+def _pdfium_page_texts(pdf_bytes: bytes) -> list | None:
+    """Text of every page via pypdfium2 (far faster than pdfminer); None if unavailable.
+
+    Only used when `use_pdfium=True`: its line layout has not been checked against
+    pdfplumber's extract_text() on a real Hashtag Basketball PDF, and a page it
+    mis-splits would silently win over the pdfplumber paths.
+    """
+    try:
+        import pypdfium2 as pdfium
+    except Exception:
+        return None
+    with _pdfium_lock():
+        try:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+        except Exception:
+            return None
+        try:
+            texts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range())
+                textpage.close(); page.close()
+            return texts
+        except Exception:
+            return None
+        finally:
+            pdf.close()
+
+def _adp_ranks(blend: pd.Series) -> pd.arrays.IntegerArray:
+    """1..N for a Blend column already sorted ascending with NaN last; NaN rows get <NA>."""
+    n = int(blend.notna().sum())
+    idx = np.arange(len(blend), dtype=np.int64)
+    return pd.arrays.IntegerArray(idx + 1, mask=idx >= n)
+
+def _compact_dtypes(df: pd.DataFrame) -> None:
+    """In place: Team/Pos → category (few distinct values), Player → Arrow-backed string
+    so isin() uses Arrow's C++ hash kernels (pyarrow ships with streamlit)."""
+    df["Team"] = df["Team"].astype("category")
+    df["Pos"]  = df["Pos"].astype("category")
+    df["Player"] = df["Player"].astype("string[pyarrow]")
+
 # -------- Cache the PDF parse so it runs once per file --------
-@st.cache_data(show_spinner=False)
-def parse_pdf_cached(pdf_bytes: bytes) -> pd.DataFrame:
-    """Parse Hashtag Basketball ADP PDF; return DataFrame [Player, Team, Pos, Blend, ADP_Rank]."""
+def parse_pdf_cached(pdf_bytes: bytes, prefer_text: bool = True,
+                     use_pdfium: bool = False) -> pd.DataFrame:
+    """Parse Hashtag Basketball ADP PDF; return DataFrame [Player, Team, Pos, Blend, ADP_Rank].
+
+    `use_pdfium` opts in to pypdfium2 as the text producer (pdfplumber covers pages it misses).
+    """
+    # Key on the content (not the per-upload file_id) so re-uploading the same PDF hits the cache
+    key = hashlib.blake2b(pdf_bytes, digest_size=8).digest()
+    return _parse_pdf_by_key(key, pdf_bytes, prefer_text, use_pdfium)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _parse_pdf_by_key(key: bytes, _pdf_bytes: bytes, prefer_text: bool = True,
+                      use_pdfium: bool = False) -> pd.DataFrame:
+    """Cached parse; `_pdf_bytes` is skipped by Streamlit's hasher, `key` identifies the file."""
+    pdf_bytes = _pdf_bytes
     try:
         import pdfplumber
     except Exception:
         return pd.DataFrame(columns=["Player","Team","Pos","Blend","ADP_Rank"])
 
-    def _clean(s: str) -> str:
-        return re.sub(r"\s+", " ", s or "").strip()
+    # pypdfium2 (opt-in) produces the text layer; pdfplumber handles whatever it misses
+    texts = _pdfium_page_texts(pdf_bytes) if prefer_text and use_pdfium else None
+    page_rows = [_rows_from_text(t) for t in texts] if texts is not None else None
+    if page_rows is None or not all(page_rows):
+        # With pdfium text in hand, empty pages go to table detection first
+        fallback_prefer_text = prefer_text and page_rows is None
+        with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+            if page_rows is None:
+                page_rows = [[] for _ in pdf.pages]
+            for i, rows in enumerate(page_rows):
+                if not rows:
+                    page_rows[i] = _parse_page(pdf.pages[i], fallback_prefer_text)
 
-    rows = []
-    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            # 1) Try table extraction first
-            for tbl in (page.extract_tables() or []):
-                # Find header row that has BL or BLEND
-                header_idx = None
-                for i, r in enumerate(tbl[:3]):
-                    joined = " ".join([_clean(c) for c in r if c])
-                    if re.search(r"\bBL(END)?\b", joined, flags=re.I):
-                        header_idx = i; break
-                if header_idx is not None:
-                    headers = [(_clean(c) or f"C{j}") for j, c in enumerate(tbl[header_idx])]
-                    colmap = {h.lower(): j for j, h in enumerate(headers)}
-                    # locate likely columns
-                    blend_idx = None
-                    for j, h in enumerate(headers):
-                        if re.fullmatch(r"bl(end)?", _clean(h).lower()):
-                            blend_idx = j; break
-                    player_idx = colmap.get("player", 0)
-                    team_idx   = colmap.get("team")
-                    pos_idx    = colmap.get("pos")
-                    for r in tbl[header_idx+1:]:
-                        if not any(r): continue
-                        def g(idx):
-                            try: return r[idx]
-                            except Exception: return None
-                        player = _clean(g(player_idx))
-                        if not player or len(player.split()) < 2: continue
-                        team = _clean(g(team_idx)) if team_idx is not None else ""
-                        pos  = _clean(g(pos_idx))  if pos_idx  is not None else ""
-                        blend_raw = _clean(g(blend_idx)) if blend_idx is not None else ""
-                        # numeric at end of cell
-                        m = re.search(r"(\d+(?:\.\d+)?)", blend_raw) if blend_raw else None
-                        blend = float(m.group(1)) if m else None
-                        rows.append((player, team, pos, blend))
-
-            # 2) Fallback: parse text lines (ignore URLs)
-            text = page.extract_text() or ""
-            for raw in text.splitlines():
-                line = _clean(raw)
-                if not line: 
-                    continue
-                # Skip obvious headers/footers/links
-                if re.search(r"(https?://\S+)|(ADP Data|Hashtag Basketball|Season|Updated|\bBL(END)?\b)", line, flags=re.I):
-                    continue
-                # Last float on line as Blend
-                m_end = re.search(r"(\d+(?:\.\d+)?)\s*$", line)
-                if not m_end:
-                    continue
-                blend = float(m_end.group(1))
-                body = re.sub(r"(\d+(?:\.\d+)?)\s*$", "", line).strip()
-                body = re.sub(r"^\s*\d+[\.\-]?\s*", "", body)  # remove leading index like "12." or "12 -"
-
-                # Try to peel team code (2-4 caps) at end; keep simple pos detection in parentheses
-                pos = ""
-                m_pos = re.search(r"\(([A-Z/]+)\)", body)
-                if m_pos:
-                    pos = m_pos.group(1)
-                    body = (body[:m_pos.start()] + body[m_pos.end():]).strip()
-
-                parts = body.split()
-                team = ""
-                if parts and re.fullmatch(r"[A-Z]{2,4}", parts[-1]):
-                    team = parts[-1]; parts = parts[:-1]
-                player = _clean(" ".join(parts))
-                # Also skip anything that looks like a bare link that slipped through
-                if re.match(r"^https?://", player, flags=re.I):
-                    continue
-                if len(player.split()) >= 2:
-                    rows.append((player, team, pos, blend))
-
-    if not rows:
+    # Transpose row tuples into column tuples in C rather than appending per row
+    columns = list(zip(*itertools.chain.from_iterable(page_rows)))
+    if not columns:
         return pd.DataFrame(columns=["Player","Team","Pos","Blend","ADP_Rank"])
+    players, teams, positions, blends = columns
 
-    df = pd.DataFrame(rows, columns=["Player","Team","Pos","Blend"])
-    df["Blend"] = pd.to_numeric(df["Blend"], errors="coerce")
+    # Blend values are already floats/None; a float64 column turns None into NaN
+    df = pd.DataFrame({"Player": players, "Team": teams, "Pos": positions,
+                       "Blend": pd.Series(blends, dtype="float64")})
     # Rank by Blend (lower is earlier)
-    df = df.sort_values(["Blend","Player"], ascending=[True, True], na_position="last")
-    df = df.drop_duplicates(subset=["Player"], keep="first").reset_index(drop=True)
+    # Single-key stable sort keeps the lowest-Blend row per player; ties stay in PDF order
+    df = (df.sort_values("Blend", na_position="last", kind="stable")
+            .drop_duplicates("Player", keep="first")
+            .reset_index(drop=True))
     # Keep top 300 by Blend
     df = df.head(300).copy()
-    df["ADP_Rank"] = (df["Blend"].rank(method="first")).astype("Int64")
+    df["ADP_Rank"] = _adp_ranks(df["Blend"])
+    _compact_dtypes(df)
     return df[["Player","Team","Pos","Blend","ADP_Rank"]]
 
 def parse_csv(file) -> pd.DataFrame:
@@ -115,19 +237,22 @@ def parse_csv(file) -> pd.DataFrame:
     col_team   = pick("team","tm")
     col_pos    = pick("pos","position")
 
-    out = pd.DataFrame()
-    out["Player"] = df[col_player] if col_player else df.iloc[:,0]
-    out["Team"]   = df[col_team] if col_team else ""
-    out["Pos"]    = df[col_pos] if col_pos else ""
-    out["Blend"]  = pd.to_numeric(df[col_blend], errors="coerce") if col_blend else None
+    # One constructor call instead of growing an empty frame column by column
+    out = pd.DataFrame({
+        "Player": df[col_player] if col_player else df.iloc[:,0],
+        "Team":   df[col_team] if col_team else "",
+        "Pos":    df[col_pos] if col_pos else "",
+        "Blend":  pd.to_numeric(df[col_blend], errors="coerce") if col_blend else np.nan,
+    })
     out = out.sort_values(["Blend","Player"], ascending=[True,True], na_position="last").reset_index(drop=True)
     out = out.head(300).copy()
-    out["ADP_Rank"] = (out["Blend"].rank(method="first")).astype("Int64")
+    out["ADP_Rank"] = _adp_ranks(out["Blend"])
+    _compact_dtypes(out)
     return out[["Player","Team","Pos","Blend","ADP_Rank"]]
 
 # -------- Session State --------
 if "players_df" not in st.session_state: st.session_state["players_df"] = None
-if "drafted"    not in st.session_state: st.session_state["drafted"] = set()
+if "drafted"    not in st.session_state: st.session_state["drafted"] = {}  # insertion-ordered name → True
 
 # -------- Upload --------
 st.markdown("### 1) Upload ADP list (PDF or CSV)")
@@ -138,7 +263,7 @@ with c2:
     up_csv = st.file_uploader("Or CSV with Player, Team, Pos, Blend", type=["csv"])
 
 if up_pdf is not None and st.session_state["players_df"] is None:
-    st.session_state["players_df"] = parse_pdf_cached(up_pdf.read())
+    st.session_state["players_df"] = parse_pdf_cached(up_pdf.getvalue())
 elif up_csv is not None and st.session_state["players_df"] is None:
     st.session_state["players_df"] = parse_csv(up_csv)
 
@@ -147,16 +272,24 @@ df = st.session_state["players_df"]
 if df is None or len(df) == 0:
     st.info("Upload a PDF or CSV to begin. We’ll rank by **Blend** and keep the top 300.")
 else:
-    # Build Remaining and Drafted
-    remaining_df = df[~df["Player"].isin(st.session_state["drafted"])].copy()
-    drafted_df   = df[df["Player"].isin(st.session_state["drafted"])].copy()
+    # Build Remaining and Drafted (read-only views of df — never mutated below)
+    drafted = st.session_state["drafted"]
+    if not drafted:
+        remaining_df = df
+        drafted_df   = df.iloc[0:0]
+    else:
+        mask         = df["Player"].isin(list(drafted))
+        remaining_df = df.loc[~mask]
+        drafted_df   = df.loc[mask]
 
     # ---- Editable "Draft" checkbox column on the Remaining table ----
     st.markdown("### 2) Remaining Players")
-    remaining_df = remaining_df.sort_values(["Blend","Player"], ascending=[True,True]).reset_index(drop=True)
-    remaining_df["Draft"] = False  # temp checkbox column (not stored)
+    # df is already sorted by Blend and the mask preserves order — no re-sort needed.
+    # assign() returns a new frame, so the temp checkbox column never touches df
+    editor_df = (remaining_df[["ADP_Rank","Player","Team","Pos","Blend"]]
+                 .assign(Draft=False)[["Draft","ADP_Rank","Player","Team","Pos","Blend"]])
     edited = st.data_editor(
-        remaining_df[["Draft","ADP_Rank","Player","Team","Pos","Blend"]],
+        editor_df,
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -168,13 +301,15 @@ else:
             "Blend": st.column_config.NumberColumn("Blend (lower = earlier)"),
         },
         num_rows="fixed",
+        # Only the checkbox is editable; Team/Pos are categoricals and reject new values
+        disabled=["ADP_Rank","Player","Team","Pos","Blend"],
         key="remaining_editor"
     )
 
     # Button to move all checked rows → Drafted
     to_draft = edited.loc[edited["Draft"] == True, "Player"].tolist()
     if st.button(f"✅ Move {len(to_draft)} selected to Drafted", type="primary", disabled=(len(to_draft)==0)):
-        st.session_state["drafted"].update(to_draft)
+        st.session_state["drafted"].update({p: True for p in to_draft})
         st.rerun()
 
     # ---- Drafted table (read-only) ----
@@ -190,7 +325,7 @@ else:
     cex1, cex2, cex3 = st.columns(3)
     with cex1:
         st.download_button("⬇️ Export Remaining (CSV)",
-            remaining_df.drop(columns=["Draft"]).to_csv(index=False).encode(),
+            remaining_df.to_csv(index=False).encode(),
             "remaining_players.csv","text/csv"
         )
     with cex2:
@@ -200,5 +335,5 @@ else:
         )
     with cex3:
         if st.button("🧹 Reset Drafted"):
-            st.session_state["drafted"] = set()
+            st.session_state["drafted"] = {}
             st.rerun()